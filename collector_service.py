@@ -0,0 +1,306 @@
+# 企業の財務指標と財務情報を常駐して保持し、ローカルのHTTP APIで返す
+# 東証上場銘柄一覧、取得結果、最新の財務指標をメモリ上に保持し、定期的に更新する
+# - 株価と配当の指標は短い間隔(既定値:15分)で更新する
+# - 財務指標と財務情報は長い間隔(既定値:24時間)で更新する
+# 起動時に前回の出力ファイル(company_metrics.csv、company_financial_info.csv)があれば読み込み、すぐに問い合わせに応答する
+# usage: python collector_service.py [--listing FILE ...] [--host HOST] [--port PORT]
+#                                    [--price-interval SEC] [--statement-interval SEC] [--cache-size N]
+# API一覧(応答はJSON)
+# - GET /symbols/<証券コード>   例:/symbols/1301、/symbols/1301.T
+#    企業の財務指標と過去の財務情報
+# - GET /sectors/<33業種区分>   例:/sectors/水産・農林業
+#    業種に含まれる企業の財務指標の一覧
+# - GET /status
+#    銘柄数、最終更新日時
+
+# 標準ライブラリの読み込み
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+# データフレームのライブラリを読み込む
+import pandas as pd
+
+# yahooqueryのライブラリを読み込む
+from yahooquery import Ticker
+
+# 財務指標と財務情報を取得する処理を読み込む
+from gather_financial_info import (apply_dividend_metrics, build_company_financial_info, build_company_metrics,
+                                   get_company_finacial_info, get_company_metrics, load_listing, save_company_info)
+
+# 未取得の属性を記録する台帳を読み込む
+from missing_field_ledger import MissingFieldLedger
+
+# 株価と配当の履歴から配当の指標を算出するモジュールを読み込む
+from dividend_history import calc_dividend_metrics, update_price_history
+
+
+# 財務指標の表を作り直す間隔(銘柄数)
+REBUILD_EVERY = 100
+
+
+# 財務指標と財務情報を常駐して保持するクラス
+class CollectorService:
+
+    # 初期化
+    # 引数:東証上場銘柄一覧のファイル名のリスト、株価の更新間隔(秒)、財務情報の更新間隔(秒)、問い合わせ結果の保持件数
+    # 戻値:無し
+    def __init__(self, listing_paths, price_interval=15 * 60, statement_interval=24 * 60 * 60, cache_size=4096):
+        self.price_interval = price_interval
+        self.statement_interval = statement_interval
+
+        # 東証上場銘柄一覧を読み込み、全ての銘柄一覧の和集合を求める
+        self.df_data_j = pd.concat([load_listing(listing_path) for listing_path in listing_paths]).drop_duplicates('コード')
+
+        # 証券コードごとの取得結果
+        self.company_metrics = {}
+        self.company_financial_info = {}
+        self.df_dividend_metrics = None
+
+        # 問い合わせに使う最新の財務指標(indexが証券コード)と財務情報(証券コードごと)
+        # 更新時は新しいオブジェクトを作ってから差し替えるため、読み出し側はロック不要
+        # 前回の出力ファイルが無い場合も業種等で問い合わせできるよう、列名のみの表から始める
+        self.df_company_metrics = build_company_metrics(self.df_data_j.iloc[:0], {}, None).set_index('ticker', drop=False)
+        self.financial_info_by_symbol = {}
+
+        # 最終更新日時
+        self.price_updated_at = None
+        self.statement_updated_at = None
+
+        # 株価の更新と財務情報の更新は別のスレッドで行うため、表の作り直しは排他する
+        self.rebuild_lock = threading.Lock()
+
+        # 問い合わせ結果のJSONを版番号ごとに保持する(表を差し替えると版番号が変わり、古い結果は使われない)
+        self.version = 0
+        self.cached_query = lru_cache(maxsize=cache_size)(self._query)
+
+        self.load_saved_results()
+
+    # 前回の出力ファイルを読み込み、起動直後から問い合わせに応答できるようにする
+    # 引数:無し
+    # 戻値:無し
+    def load_saved_results(self):
+        if not os.path.isfile('./company_metrics.csv'):
+            return
+
+        print('前回の出力ファイルを読み込みます。')
+        # 以前の出力ファイルには値の無い属性が{}として保存されているため、NaNとして読み込む
+        df_company_metrics = pd.read_csv('./company_metrics.csv', encoding='cp932', na_values=['{}'])
+        df_company_metrics['ticker'] = df_company_metrics['ticker'].astype(str)
+
+        financial_info_by_symbol = {}
+        if os.path.isfile('./company_financial_info.csv'):
+            df_company_financial_info = pd.read_csv('./company_financial_info.csv', encoding='cp932')
+            financial_info_by_symbol = dict(list(df_company_financial_info.groupby('symbol')))
+
+        self.publish(df_company_metrics, financial_info_by_symbol)
+
+    # 株価と配当の履歴を更新し、配当の指標を算出する
+    # 引数:無し
+    # 戻値:無し
+    def refresh_prices(self):
+        symbols = (self.df_data_j['コード'].astype(str) + '.T').tolist()
+        self.df_dividend_metrics = calc_dividend_metrics(update_price_history(symbols)).reindex(symbols)
+        self.price_updated_at = datetime.now()
+
+        # 取得済みの財務指標に配当の指標を反映する
+        if self.company_metrics:
+            self.rebuild()
+        elif not self.df_company_metrics.empty:
+            df_company_metrics = apply_dividend_metrics(self.df_company_metrics, self.df_dividend_metrics)
+            self.publish(df_company_metrics, self.financial_info_by_symbol)
+
+    # 全銘柄の財務指標と財務情報を取得する
+    # 取得中も一定の銘柄数ごとに問い合わせ用の表を作り直し、取得済みの銘柄から応答できるようにする
+    # 引数:無し
+    # 戻値:無し
+    def refresh_statements(self):
+        ledger = MissingFieldLedger()
+        for i, ticker in enumerate(self.df_data_j['コード']):
+            ticker_num = str(ticker) + '.T'
+            ticker_data = Ticker(ticker_num)
+            df_metrics = get_company_metrics(ticker_num, ticker_data, ledger)
+            df_financial_info = get_company_finacial_info(ticker_num, ticker_data, ledger)
+
+            # 株価の更新スレッドが表を作り直す際に片方だけ取得済みの銘柄が現れないよう、両方をまとめて保存する
+            with self.rebuild_lock:
+                self.company_metrics[ticker] = df_metrics
+                self.company_financial_info[ticker] = df_financial_info
+
+            if (i + 1) % REBUILD_EVERY == 0:
+                self.rebuild()
+
+        self.rebuild()
+        self.statement_updated_at = datetime.now()
+
+        # バッチ処理と同じ出力ファイルも更新する
+        save_company_info('', self.df_data_j, self.company_metrics, self.company_financial_info, self.df_dividend_metrics)
+        series_sector = pd.Series(self.df_data_j['33業種区分'].values, index=self.df_data_j['コード'].astype(str) + '.T')
+        ledger.flush(series_sector)
+
+    # 取得済みの銘柄から問い合わせ用の表を作り直す
+    # 今回の更新でまだ取得していない銘柄は、前回の出力ファイル等から読み込んだ行を残す
+    # 引数:無し
+    # 戻値:無し
+    def rebuild(self):
+        with self.rebuild_lock:
+            df_data_j = self.df_data_j[self.df_data_j['コード'].isin(self.company_metrics.keys() & self.company_financial_info.keys())]
+            df_company_metrics = build_company_metrics(df_data_j, self.company_metrics, self.df_dividend_metrics)
+            df_company_financial_info = build_company_financial_info(df_data_j, self.company_financial_info)
+
+            financial_info_by_symbol = {}
+            if not df_company_financial_info.empty:
+                financial_info_by_symbol = dict(list(df_company_financial_info.groupby('symbol')))
+
+            # 公開中の表から、銘柄一覧に含まれ、まだ取得していない銘柄の行を引き継ぐ
+            series_symbol = self.df_data_j['コード'].astype(str) + '.T'
+            df_rest = self.df_company_metrics.reset_index(drop=True)
+            df_rest = df_rest[df_rest['ticker'].isin(series_symbol) & ~df_rest['ticker'].isin(df_company_metrics['ticker'])]
+            if not df_rest.empty:
+                if self.df_dividend_metrics is not None:
+                    df_rest = apply_dividend_metrics(df_rest, self.df_dividend_metrics)
+                for symbol in df_rest['ticker']:
+                    if symbol in self.financial_info_by_symbol:
+                        financial_info_by_symbol[symbol] = self.financial_info_by_symbol[symbol]
+
+                # 銘柄一覧の順に並べる
+                series_position = pd.Series(range(len(series_symbol)), index=series_symbol.values)
+                df_company_metrics = pd.concat([df_company_metrics.reset_index(drop=True), df_rest])
+                df_company_metrics = df_company_metrics.sort_values('ticker', key=lambda series: series.map(series_position))
+
+            self.publish(df_company_metrics, financial_info_by_symbol)
+
+    # 問い合わせ用の表を差し替え、保持している問い合わせ結果を破棄する
+    # 引数:企業の財務指標:Dataframe、証券コードごとの企業の財務状況
+    # 戻値:無し
+    def publish(self, df_company_metrics, financial_info_by_symbol):
+        self.df_company_metrics = df_company_metrics.reset_index(drop=True).set_index('ticker', drop=False)
+        self.financial_info_by_symbol = financial_info_by_symbol
+        self.version += 1
+        self.cached_query.cache_clear()
+
+    # 問い合わせに応答する
+    # 引数:問い合わせの種類(symbols、sectors)、証券コードまたは33業種区分
+    # 戻値:応答のJSON:bytes、該当が無い場合はNone
+    def query(self, kind, key):
+        return self.cached_query(self.version, kind, key)
+
+    # 問い合わせの結果を作成する(結果はself.cached_queryで保持される)
+    # 引数:版番号、問い合わせの種類(symbols、sectors)、証券コードまたは33業種区分
+    # 戻値:応答のJSON:bytes、該当が無い場合はNone
+    def _query(self, version, kind, key):
+        df_company_metrics = self.df_company_metrics
+        if kind == 'symbols':
+            ticker_num = key if key.endswith('.T') else key + '.T'
+            if ticker_num not in df_company_metrics.index:
+                return None
+            df_financial_info = self.financial_info_by_symbol.get(ticker_num, pd.DataFrame())
+            return ('{{"metrics":{},"financial_info":{}}}'.format(
+                df_company_metrics.loc[[ticker_num]].head(1).to_json(orient='records', force_ascii=False)[1:-1],
+                df_financial_info.to_json(orient='records', force_ascii=False, date_format='iso'))).encode('utf-8')
+
+        if kind == 'sectors':
+            df_sector = df_company_metrics[df_company_metrics['type_33'] == key]
+            if df_sector.empty:
+                return None
+            return df_sector.to_json(orient='records', force_ascii=False).encode('utf-8')
+
+        return None
+
+    # 稼働状況を返す
+    # 引数:無し
+    # 戻値:稼働状況:dict
+    def status(self):
+        return {'symbols': len(self.df_data_j),
+                'loaded_symbols': len(self.df_company_metrics),
+                'price_updated_at': self.price_updated_at and self.price_updated_at.isoformat(),
+                'statement_updated_at': self.statement_updated_at and self.statement_updated_at.isoformat(),
+                'cache': self.cached_query.cache_info()._asdict()}
+
+    # 更新間隔に従って更新処理を繰り返す
+    # 引数:更新処理、更新間隔(秒)
+    # 戻値:無し
+    def run_scheduler(self, refresh, interval):
+        while True:
+            next_run = time.monotonic() + interval
+            try:
+                refresh()
+            except Exception as e:
+                print('更新に失敗しました:{}'.format(e))
+            time.sleep(max(0, next_run - time.monotonic()))
+
+
+# HTTPの問い合わせを処理するクラス
+class CollectorRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    # GETの問い合わせに応答する
+    # 引数:無し
+    # 戻値:無し
+    def do_GET(self):
+        parts = unquote(self.path.split('?')[0]).strip('/').split('/')
+
+        if parts == ['status']:
+            body = json.dumps(self.service.status(), ensure_ascii=False).encode('utf-8')
+        elif len(parts) == 2:
+            body = self.service.query(parts[0], parts[1])
+        else:
+            body = None
+
+        if body is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # 問い合わせごとのログを出力しない
+    def log_message(self, format, *args):
+        pass
+
+
+# メイン処理
+# 引数:コマンドライン引数
+# 戻値:無し
+def main(args):
+    service = CollectorService(args.listing, args.price_interval, args.statement_interval, args.cache_size)
+
+    # 株価と財務情報の更新はそれぞれ別のスレッドで行い、財務情報の取得中も株価を更新できるようにする
+    threading.Thread(target=service.run_scheduler, args=(service.refresh_prices, service.price_interval), daemon=True).start()
+    threading.Thread(target=service.run_scheduler, args=(service.refresh_statements, service.statement_interval), daemon=True).start()
+
+    CollectorRequestHandler.service = service
+    server = ThreadingHTTPServer((args.host, args.port), CollectorRequestHandler)
+    print('http://{}:{}/ で問い合わせを受け付けます。'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+# コマンドライン引数を解析する
+# 引数:無し
+# 戻値:コマンドライン引数
+def parse_args():
+    parser = argparse.ArgumentParser(description='企業の財務指標と財務情報を常駐して保持し、ローカルのHTTP APIで返す')
+    parser.add_argument('--listing', nargs='+', default=['./data_j.xls'],
+                        help='東証上場銘柄一覧のファイル名')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=8765, help='待ち受けるポート')
+    parser.add_argument('--price-interval', type=int, default=15 * 60, help='株価と配当の指標の更新間隔(秒)')
+    parser.add_argument('--statement-interval', type=int, default=24 * 60 * 60, help='財務指標と財務情報の更新間隔(秒)')
+    parser.add_argument('--cache-size', type=int, default=4096, help='問い合わせ結果を保持する件数')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,165 @@
+# 株価と配当の日次履歴から配当利回り等の指標を算出する
+# 全銘柄の日次履歴を初回にまとめて取得してキャッシュし、2回目以降はキャッシュ以降の差分のみを取得する
+# 出力ファイルの一覧
+# - price_history.pkl
+#    銘柄、日付ごとの終値、配当金(キャッシュ)
+# - dividend_metrics.csv
+#    証券コード,配当利回り,過去5年間の配当利回り平均,配当の継続性
+
+# 標準ライブラリの読み込み
+import os
+
+import numpy as np
+
+# データフレームのライブラリを読み込む
+import pandas as pd
+
+# yahooqueryのライブラリを読み込む
+from yahooquery import Ticker
+
+# プログレスバーを表示するためのライブラリを読み込む
+from tqdm import tqdm
+
+
+# 1回のリクエストでまとめて取得する銘柄数
+CHUNK_SIZE = 200
+
+# 初回に取得する期間(過去5年間の平均を求めるため、直近1年間の配当の集計期間の分だけ長く取得する)
+BACKFILL_PERIOD = '6y'
+
+
+# キャッシュした株価と配当の履歴を読み込む
+# 引数:キャッシュの保存先
+# 戻値:株価と配当の履歴:Dataframe(indexが銘柄、日付)
+def load_price_history(path='./price_history.pkl'):
+    if os.path.isfile(path):
+        return pd.read_pickle(path)
+    return empty_price_history()
+
+
+# 空の株価と配当の履歴を用意する
+# 引数:無し
+# 戻値:株価と配当の履歴:Dataframe(indexが銘柄、日付)
+def empty_price_history():
+    return pd.DataFrame(columns=['close', 'dividends'], dtype=float,
+                        index=pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=['symbol', 'date']))
+
+
+# 株価と配当の履歴を取得してキャッシュを更新する
+# キャッシュに無い銘柄は全期間、キャッシュにある銘柄は銘柄ごとの最終日以降のみを取得する
+# 引数:証券コードのリスト、キャッシュの保存先
+# 戻値:株価と配当の履歴:Dataframe(indexが銘柄、日付)
+def update_price_history(symbols, path='./price_history.pkl'):
+    df_history = load_price_history(path)
+
+    cached_symbols = set(df_history.index.get_level_values('symbol'))
+    new_symbols = [symbol for symbol in symbols if symbol not in cached_symbols]
+    update_symbols = [symbol for symbol in symbols if symbol in cached_symbols]
+
+    df_fetched = [df_history]
+
+    # キャッシュに無い銘柄は全期間を取得する
+    if new_symbols:
+        print('株価と配当の履歴を取得します。({}銘柄)'.format(len(new_symbols)))
+        df_fetched.append(fetch_price_history(new_symbols, period=BACKFILL_PERIOD))
+
+    # キャッシュにある銘柄は銘柄ごとの最終日以降の株価のみを取得する
+    # 前回の取得に失敗した銘柄は最終日が古いため、最終日ごとにまとめて取得し、欠けた期間を埋める
+    if update_symbols:
+        series_last_date = df_history.reset_index('date')['date'].groupby(level='symbol').max()
+        series_last_date = series_last_date.reindex(update_symbols)
+        for last_date, symbols_since in series_last_date.groupby(series_last_date):
+            print('株価と配当の履歴を{}以降の分だけ更新します。({}銘柄)'.format(last_date.date(), len(symbols_since)))
+            df_fetched.append(fetch_price_history(symbols_since.index.tolist(), start=last_date.strftime('%Y-%m-%d')))
+
+    # 同じ銘柄、日付は後から取得した値を優先する
+    df_history = pd.concat(df_fetched)
+    df_history = df_history[~df_history.index.duplicated(keep='last')].sort_index()
+    df_history.to_pickle(path)
+
+    return df_history
+
+
+# 複数銘柄の株価と配当の履歴をまとめて取得する
+# 引数:証券コードのリスト、yahooqueryのhistoryに渡す引数
+# 戻値:株価と配当の履歴:Dataframe(indexが銘柄、日付)
+def fetch_price_history(symbols, **kwargs):
+    df_chunks = []
+    for i in tqdm(range(0, len(symbols), CHUNK_SIZE)):
+        ticker_data = Ticker(symbols[i:i + CHUNK_SIZE], asynchronous=True)
+        try:
+            df_chunk = ticker_data.history(interval='1d', **kwargs)
+        except Exception as e:
+            print(e)
+            continue
+
+        # 全銘柄の取得に失敗した場合はデータフレームではなく辞書が返される
+        if not isinstance(df_chunk, pd.DataFrame) or df_chunk.empty:
+            continue
+
+        # 期間中に配当が無い場合は配当金の列が無い
+        if 'dividends' not in df_chunk.columns:
+            df_chunk['dividends'] = 0.0
+
+        df_chunks.append(df_chunk[['close', 'dividends']])
+
+    if not df_chunks:
+        return empty_price_history()
+
+    df_history = pd.concat(df_chunks)
+
+    # 日付はdate型と当日分のdatetime型が混在するため、日単位のTimestampに揃える
+    dates = pd.to_datetime(df_history.index.get_level_values('date').map(str).str[:10])
+    df_history.index = pd.MultiIndex.from_arrays([df_history.index.get_level_values('symbol'), dates],
+                                                 names=['symbol', 'date'])
+
+    return df_history
+
+
+# 株価と配当の履歴から配当利回り、過去5年間の配当利回り平均、配当の継続性を計算する
+# 引数:株価と配当の履歴:Dataframe(indexが銘柄、日付)
+# 戻値:配当の指標:Dataframe(indexが銘柄)
+def calc_dividend_metrics(df_history):
+    # 全銘柄の取得に失敗した場合等、履歴が無い場合は値の無い表とする
+    if df_history.empty:
+        return pd.DataFrame(columns=['dividendYield', 'fiveYearAvgDividendYield', 'dividendConsistency'], dtype=float,
+                            index=pd.Index([], name='ticker'))
+
+    # 行が日付、列が銘柄の表に変換する
+    df_close = df_history['close'].unstack(level='symbol').sort_index().ffill()
+    df_dividends = df_history['dividends'].unstack(level='symbol').sort_index().fillna(0)
+
+    # 上場前(終値が無い期間)は配当が無いのではなく対象外として扱う
+    df_listed = df_close.notna()
+    df_dividends = df_dividends.where(df_listed)
+
+    # 直近1年間の配当金の合計を終値で割り、日ごとの配当利回りを求める
+    df_trailing_yield = df_dividends.rolling('365D').sum().where(df_listed) / df_close.replace(0, np.nan)
+
+    # 直近の配当利回り
+    series_dividend_yield = df_trailing_yield.iloc[-1]
+
+    # 過去5年間の配当利回り平均(summary_detailのfiveYearAvgDividendYieldに合わせて百分率とする)
+    # 各銘柄の履歴の最初の1年間は直近1年間の配当の合計がそろわないため除外する
+    last_date = df_trailing_yield.index[-1]
+    series_first_date = df_listed.idxmax()
+    df_full_window = pd.DataFrame(df_trailing_yield.index.values[:, None] >= (series_first_date + pd.Timedelta(days=365)).values[None, :],
+                                  index=df_trailing_yield.index, columns=df_trailing_yield.columns)
+    df_recent_yield = df_trailing_yield.where(df_full_window)
+    df_recent_yield = df_recent_yield[df_recent_yield.index > last_date - pd.DateOffset(years=5)]
+    series_five_year_avg_yield = df_recent_yield.mean() * 100
+
+    # 過去5年間(完了した年)のうち年初から上場していた年に対する、配当があった年の割合を配当の継続性とする
+    # 年の途中で上場した年は配当の時期を過ぎている場合があるため対象外とする
+    df_year_start_listed = df_listed.groupby(df_listed.index.year).head(1)
+    df_year_start_listed.index = df_year_start_listed.index.year
+    df_annual_dividends = df_dividends.groupby(df_dividends.index.year).sum(min_count=1).where(df_year_start_listed)
+    df_annual_dividends = df_annual_dividends[df_annual_dividends.index < last_date.year].tail(5)
+    series_consistency = (df_annual_dividends > 0).astype(float).where(df_annual_dividends.notna()).mean()
+
+    df_dividend_metrics = pd.DataFrame({'dividendYield':            series_dividend_yield,
+                                        'fiveYearAvgDividendYield': series_five_year_avg_yield,
+                                        'dividendConsistency':      series_consistency})
+    df_dividend_metrics.index.name = 'ticker'
+
+    return df_dividend_metrics
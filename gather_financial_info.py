@@ -2,21 +2,57 @@
 # 事前に以下のリンクから東証上場銘柄一覧を取得し、[data_j.xls]のファイル名で保存する
 # https://www.jpx.co.jp/markets/statistics-equities/misc/01.html
 # 本プログラムと[data_j.xls]を同一フォルダに配置する
-# usage: python gather_financial_info.py
+# usage: python gather_financial_info.py [--listing FILE ...] [--local-dividends | --dividends-only] [--profile [--profile-top N]]
+#                                        [--snapshot [--snapshot-name NAME ...]]
+#    --listing          東証上場銘柄一覧のファイル名(既定値:data_j.xls)
+#                       複数指定した場合は重複する銘柄を1回だけ取得し、銘柄一覧ごとに出力ファイルを分ける
+#                       例:--listing data_j.xls data_j2.xls → company_metrics_data_j.csv、company_metrics_data_j2.csv
+#                       ファイル名が同じ場合は親フォルダ名を付ける 例:2026-09/data_j.xls → company_metrics_2026-09_data_j.csv
+#    --local-dividends  配当利回り、過去5年間の配当利回り平均を株価と配当の履歴から算出する
+#    --dividends-only   株価と配当の履歴のみを更新し、配当の指標を[dividend_metrics.csv]に保存する
+#    --profile          銘柄ごとの処理時間を通信とローカル処理に分けて計測し、処理の遅い銘柄を保存する
+#    --snapshot         出力した表を当日の版としてsnapshots/に差分で保存する(復元はsnapshot_store.pyを参照)
+#                       表の名前には、同時に指定した他の銘柄一覧によらず銘柄一覧のファイル名を付ける 例:company_metrics_data_j
+#    --snapshot-name    版を保存する表の名前に付ける名前(--listingと同じ順に銘柄一覧ごとに指定する)
+#                       ファイル名が同じ銘柄一覧を同時に指定する場合は必ず指定する 例:--snapshot-name prime growth
 # 出力ファイルの一覧
 # - company_metrics.csv
 #    証券コード,1株当りの配当金,配当利回り,過去5年間の配当利回り平均,配当性向,時価総額
 # - company_financial_info.csv
 #    証券コード,売上高,純利益,総資産,自己資本比率,自己資本利益率
+# - dividend_metrics.csv (--local-dividends、--dividends-only指定時)
+#    証券コード,配当利回り,過去5年間の配当利回り平均,配当の継続性
+# - missing_fields.csv
+#    証券コード,取得元,属性名,理由
+# - missing_field_summary.csv
+#    属性名ごと、33業種ごとの未取得率
+# - profile_tickers.csv (--profile指定時)
+#    証券コード,処理時間,通信時間,ローカル処理時間
+# - profile_report.txt (--profile指定時)
+#    処理時間の長い上位の銘柄の処理時間とプロファイル
 
 # 標準ライブラリの読み込み
+import argparse
 import os
+from datetime import date
 
 import numpy as np
 
 # データフレームのライブラリを読み込む
 import pandas as pd
 
+# 未取得の属性を記録する台帳を読み込む
+from missing_field_ledger import MissingFieldLedger, normalize_value
+
+# 銘柄ごとの処理時間を計測するモジュールを読み込む
+from ticker_profiler import TickerProfiler
+
+# 出力した表を版として保存するモジュールを読み込む
+from snapshot_store import SnapshotStore
+
+# 株価と配当の履歴から配当の指標を算出するモジュールを読み込む
+from dividend_history import calc_dividend_metrics, update_price_history
+
 # yahooqueryのライブラリを読み込む
 from yahooquery import Ticker
 
@@ -25,16 +61,126 @@ from tqdm import tqdm
 
 
 # メイン処理
-# 引数:無し
+# 引数:コマンドライン引数
 # 戻値:無し
-def main():
+def main(args):
+    # 版を保存する表の名前を、時間のかかる取得の前に確認する
+    snapshot_names = {}
+    if args.snapshot:
+        snapshot_names = dict(zip(get_listing_names(args.listing), get_snapshot_names(args.listing, args.snapshot_name)))
+
     # 東証上場銘柄一覧を読み込む
-    is_file = os.path.isfile('./data_j.xls')
+    # 複数の銘柄一覧を指定した場合は、銘柄一覧ごとに出力ファイルを分ける
+    listings = {}
+    for listing_name, listing_path in zip(get_listing_names(args.listing), args.listing):
+        listings[listing_name] = load_listing(listing_path)
+        if listings[listing_name].empty:
+            print('東証上場銘柄一覧[{}]に取得対象の銘柄がありません。'.format(listing_path))
+
+    # 全ての銘柄一覧の証券コードの和集合を求め、同じ銘柄は1回だけ取得する
+    df_data_j = pd.concat(listings.values()).drop_duplicates('コード')
+    if len(listings) > 1:
+        print('{}件の銘柄一覧から重複を除いた{}銘柄を取得します。'.format(len(listings), len(df_data_j)))
+
+    # 株価と配当の履歴を更新し、配当の指標を算出する
+    df_dividend_metrics = None
+    if args.local_dividends or args.dividends_only:
+        symbols = (df_data_j['コード'].astype(str) + '.T').tolist()
+        df_dividend_metrics = calc_dividend_metrics(update_price_history(symbols)).reindex(symbols)
+        df_dividend_metrics.to_csv('./dividend_metrics.csv', encoding='cp932', errors='ignore')
+
+        # 配当の指標のみを更新する場合はsummary_detail等の取得を行わない
+        if args.dividends_only:
+            return
+
+    # 企業情報の指標、財務状況を証券コードごとに保持する
+    company_metrics = {}
+    company_financial_info = {}
+
+    # 未取得の属性を記録する台帳を用意する
+    ledger = MissingFieldLedger()
+
+    # 銘柄ごとの処理時間を計測する(--profile指定時のみ)
+    profiler = TickerProfiler(enabled=args.profile, top_n=args.profile_top)
+
+    # tickerの企業情報の指標、財務状況を取得する
+    for ticker in tqdm(df_data_j['コード']):
+        # 証券コードに「.T」を追加する
+        ticker_num = str(ticker) + '.T'
+
+        # 企業情報の指標、財務状況を取得する
+        with profiler.measure(ticker_num):
+            ticker_data = profiler.create(Ticker, ticker_num)
+            company_metrics[ticker] = get_company_metrics(ticker_num, ticker_data, ledger)
+            company_financial_info[ticker] = get_company_finacial_info(ticker_num, ticker_data, ledger)
+
+    # 銘柄一覧ごとに企業情報の指標、財務状況をCSVファイルに保存する
+    snapshot_store = SnapshotStore() if args.snapshot else None
+    for listing_name, df_listing in listings.items():
+        suffix = '_' + listing_name if len(listings) > 1 else ''
+        save_company_info(suffix, df_listing, company_metrics, company_financial_info, df_dividend_metrics,
+                          snapshot_store, snapshot_names.get(listing_name))
+
+    # 未取得の属性と、属性名・33業種ごとの未取得率をファイルに保存する
+    series_sector = pd.Series(df_data_j['33業種区分'].values, index=df_data_j['コード'].astype(str) + '.T')
+    ledger.flush(series_sector)
+
+    # 処理時間の長い銘柄をレポートに保存する
+    profiler.write_report()
+
+
+# 東証上場銘柄一覧の名前(出力ファイル名に使う)を求める
+# ファイル名が同じ銘柄一覧は親フォルダ名を付けて区別する(例:2026-09/data_j.xls → 2026-09_data_j)
+# 引数:東証上場銘柄一覧のファイル名のリスト
+# 戻値:東証上場銘柄一覧の名前のリスト
+def get_listing_names(listing_paths):
+    abs_paths = [os.path.abspath(listing_path) for listing_path in listing_paths]
+    if len(set(abs_paths)) != len(abs_paths):
+        print('同じ東証上場銘柄一覧が複数回指定されています。')
+        exit()
+
+    stems = [os.path.splitext(os.path.basename(abs_path))[0] for abs_path in abs_paths]
+    listing_names = []
+    for abs_path, stem in zip(abs_paths, stems):
+        if stems.count(stem) > 1:
+            stem = os.path.basename(os.path.dirname(abs_path)) + '_' + stem
+        listing_names.append(stem)
+
+    if len(set(listing_names)) != len(listing_names):
+        print('東証上場銘柄一覧の名前が重複しています。ファイル名かフォルダ名を変えてください。')
+        exit()
+
+    return listing_names
+
+
+# 版を保存する表に付ける東証上場銘柄一覧の名前を求める
+# 同じ銘柄一覧の履歴が分かれないよう、同時に指定した他の銘柄一覧によって名前を変えない
+# 引数:東証上場銘柄一覧のファイル名のリスト、指定された名前のリスト(省略時はNone)
+# 戻値:表に付ける名前のリスト
+def get_snapshot_names(listing_paths, snapshot_names=None):
+    if snapshot_names is None:
+        snapshot_names = [os.path.splitext(os.path.basename(listing_path))[0] for listing_path in listing_paths]
+    elif len(snapshot_names) != len(listing_paths):
+        print('--snapshot-nameは--listingと同じ数だけ指定してください。')
+        exit()
+
+    if len(set(snapshot_names)) != len(snapshot_names):
+        print('版を保存する表の名前が重複しています。--snapshot-nameで銘柄一覧ごとに名前を指定してください。')
+        exit()
+
+    return snapshot_names
+
+
+# 東証上場銘柄一覧を読み込み、対象外の銘柄を除外する
+# 引数:東証上場銘柄一覧のファイル名
+# 戻値:東証上場銘柄一覧:Dataframe
+def load_listing(listing_path):
+    is_file = os.path.isfile(listing_path)
     if is_file:
-        print('東証上場銘柄一覧を読み込みます。')
-        df_data_j = pd.read_excel('./data_j.xls', index_col=None)
+        print('東証上場銘柄一覧[{}]を読み込みます。'.format(listing_path))
+        df_data_j = pd.read_excel(listing_path, index_col=None)
     else:
-        print('東証上場銘柄一覧を[data_j.xls]のファイル名で保存してください。')
+        print('東証上場銘柄一覧を[{}]のファイル名で保存してください。'.format(listing_path))
         exit()
 
     # REIT・ベンチャーファンド・カントリーファンド・インフラファンドを除外する
@@ -46,72 +192,98 @@ def main():
     # 伊藤園の優先株を除外する
     df_data_j = df_data_j[df_data_j['コード'] != 25935]
 
-    # 企業情報の指標、財務状況を保存するデータフレームを用意する
-    df_company_metrics = pd.DataFrame()
-    df_company_financial_info = pd.DataFrame()
+    return df_data_j
 
-    # 企業の銘柄名、市場・商品区分、33業種、17業種を保持する
-    series_ticker_name = pd.Series()
-    series_market_product_category = pd.Series()
-    series_type_33 = pd.Series()
-    series_type_17 = pd.Series()
 
-    # tickerの企業情報の指標、財務状況を取得する
-    for ticker in tqdm(df_data_j['コード']):
-        # 証券コードに「.T」を追加する
-        df_data_j_filter = df_data_j[df_data_j['コード'] == ticker]
-        ticker_num = str(ticker) + '.T'
-        ticker_data = Ticker(ticker_num)
+# 銘柄一覧に含まれる銘柄の企業情報の指標、財務状況をCSVファイルに保存する
+# 引数:出力ファイル名の接尾辞、東証上場銘柄一覧、証券コードごとの企業の財務指標、企業の財務状況、配当の指標、版の保存先、版を保存する表の名前
+# 戻値:無し
+def save_company_info(suffix, df_data_j, company_metrics, company_financial_info, df_dividend_metrics, snapshot_store=None,
+                      snapshot_name='data_j'):
+    df_company_metrics = build_company_metrics(df_data_j, company_metrics, df_dividend_metrics)
+    df_company_financial_info = build_company_financial_info(df_data_j, company_financial_info)
 
-        series_ticker_name = pd.concat([series_ticker_name, df_data_j_filter['銘柄名']])
-        series_market_product_category = pd.concat([series_market_product_category, df_data_j_filter['市場・商品区分']])
-        series_type_33 = pd.concat([series_type_33, df_data_j_filter['33業種区分']])
-        series_type_17 = pd.concat([series_type_17, df_data_j_filter['17業種区分']])
+    # 企業情報の指標、財務状況をCSVファイルに保存する
+    df_company_metrics.to_csv('./company_metrics{}.csv'.format(suffix), encoding='cp932', index=False, errors='ignore')
+    df_company_financial_info.to_csv('./company_financial_info{}.csv'.format(suffix), encoding='cp932', index=False, errors='ignore')
 
-        # 企業情報の指標、財務状況を取得する
-        df_company_metrics = pd.concat([df_company_metrics, get_company_metrics(ticker_num, ticker_data)])
-        df_company_financial_info = pd.concat([df_company_financial_info, get_company_finacial_info(ticker_data)])
+    # 当日の版として前回の版との差分を保存する
+    # 出力ファイル名の接尾辞は同時に指定した銘柄一覧で変わるため、表の名前には別に求めた名前を付けて履歴を分けないようにする
+    if snapshot_store is not None:
+        today = date.today().isoformat()
+        snapshot_store.commit('company_metrics_' + snapshot_name, df_company_metrics, ['ticker'], today)
+        if not df_company_financial_info.empty:
+            snapshot_store.commit('company_financial_info_' + snapshot_name, df_company_financial_info, ['symbol', 'asOfDate'], today)
 
-    # 銘柄名を追加し、列を並び替える
-    df_company_metrics['ticker_name'] = series_ticker_name.values
-    df_company_metrics['market_product_category'] = series_market_product_category.values
-    df_company_metrics['type_33'] = series_type_33.values
-    df_company_metrics['type_17'] = series_type_17.values
+
+# 銘柄一覧の順に企業の財務指標を並べ、銘柄名等を追加する
+# 引数:東証上場銘柄一覧、証券コードごとの企業の財務指標、配当の指標
+# 戻値:企業の財務指標:Dataframe
+def build_company_metrics(df_data_j, company_metrics, df_dividend_metrics):
     columns = ['ticker', 'ticker_name', 'market_product_category',
                'type_33', 'type_17', 'dividendRate', 'dividendYield',
                'fiveYearAvgDividendYield', 'payoutRatio', 'MarketCap',
                'totalRevenue', 'ROE']
-    df_company_metrics = df_company_metrics.reindex(columns=columns)
+    if df_dividend_metrics is not None:
+        columns.append('dividendConsistency')
 
-    # 企業情報の指標、財務状況をCSVファイルに保存する
-    df_company_metrics.to_csv('./company_metrics.csv', encoding='cp932', index=False, errors='ignore')
-    df_company_financial_info.to_csv('./company_financial_info.csv', encoding='cp932', index=False, errors='ignore')
+    # 対象外の銘柄を除外した結果、銘柄が無い場合は列名のみの表とする
+    if df_data_j.empty:
+        return pd.DataFrame(columns=columns)
+
+    # 銘柄一覧の順に企業情報の指標を並べる
+    df_company_metrics = pd.concat([company_metrics[ticker] for ticker in df_data_j['コード']])
+
+    # 銘柄名を追加し、列を並び替える
+    df_company_metrics['ticker_name'] = df_data_j['銘柄名'].values
+    df_company_metrics['market_product_category'] = df_data_j['市場・商品区分'].values
+    df_company_metrics['type_33'] = df_data_j['33業種区分'].values
+    df_company_metrics['type_17'] = df_data_j['17業種区分'].values
+
+    # 配当利回り、過去5年間の配当利回り平均を株価と配当の履歴から算出した値に置き換える
+    if df_dividend_metrics is not None:
+        df_company_metrics = apply_dividend_metrics(df_company_metrics, df_dividend_metrics)
+
+    return df_company_metrics.reindex(columns=columns)
+
+
+# 株価と配当の履歴から算出した配当の指標を企業の財務指標に反映する
+# 履歴が無い等で算出できなかった銘柄は、summary_detailから取得した値をそのまま残す
+# 引数:企業の財務指標:Dataframe、配当の指標:Dataframe(indexが銘柄)
+# 戻値:配当の指標を反映した企業の財務指標:Dataframe
+def apply_dividend_metrics(df_company_metrics, df_dividend_metrics):
+    df_company_metrics = df_company_metrics.reset_index(drop=True)
+    for column in ['dividendYield', 'fiveYearAvgDividendYield', 'dividendConsistency']:
+        series_derived = df_company_metrics['ticker'].map(df_dividend_metrics[column])
+        if column in df_company_metrics.columns:
+            series_derived = series_derived.fillna(df_company_metrics[column])
+        df_company_metrics[column] = series_derived
+
+    return df_company_metrics
+
+
+# 銘柄一覧の順に企業の財務状況を並べる
+# 引数:東証上場銘柄一覧、証券コードごとの企業の財務状況
+# 戻値:企業の財務状況:Dataframe
+def build_company_financial_info(df_data_j, company_financial_info):
+    # 財務状況を取得できなかった銘柄(None)はpd.concatで読み飛ばされる
+    return pd.concat([pd.DataFrame()] + [company_financial_info[ticker] for ticker in df_data_j['コード']])
 
 
 # 企業の財務指標を取得する
-# 引数:証券コード、Tickerオブジェクト
+# 引数:証券コード、Tickerオブジェクト、未取得の属性の台帳
 # 戻値:企業の財務指標:Dataframe
-def get_company_metrics(ticker_num, ticker_data):
+def get_company_metrics(ticker_num, ticker_data, ledger):
     # 企業の財務指標を保存するリストを用意する
     company_metrics = [ticker_num]
 
     # summary_detailを用いて1株当りの配当金,配当利回り,過去5年間の配当利回り平均,配当性向,時価総額を取得する
     summary_detail_keys = ['dividendRate', 'dividendYield', 'fiveYearAvgDividendYield', 'payoutRatio', 'marketCap']
-    for summary_detail_key in summary_detail_keys:
-        try:
-            company_metrics.append(ticker_data.summary_detail[ticker_num][summary_detail_key])
-        except Exception as e:
-            print('証券コード:{},未取得の属性:{}'.format(ticker_num, summary_detail_key))
-            company_metrics.append(np.nan)
+    company_metrics.extend(get_endpoint_values(ticker_num, ticker_data, 'summary_detail', summary_detail_keys, ledger))
 
     # financial_dataを用いて売上高、自己資本利益率を取得する
     financial_data_keys = ['totalRevenue', 'returnOnEquity']
-    for financial_data_key in financial_data_keys:
-        try:
-            company_metrics.append(ticker_data.financial_data[ticker_num][financial_data_key])
-        except Exception as e:
-            print('証券コード:{},未取得の属性:{}'.format(ticker_num, financial_data_key))
-            company_metrics.append(np.nan)
+    company_metrics.extend(get_endpoint_values(ticker_num, ticker_data, 'financial_data', financial_data_keys, ledger))
 
     # 企業の財務指標を保存する
     # 証券コード,1株当りの配当金,配当利回り,過去5年間の配当利回り平均,配当性向,時価総額,売上高,自己資本利益率
@@ -122,17 +294,50 @@ def get_company_metrics(ticker_num, ticker_data):
     return df_company_metrics
 
 
+# 取得元(summary_detail、financial_data)から属性の値を取得する
+# 取得元は1回だけ取得し、取得できなかった属性は台帳に記録してNaNとする
+# 引数:証券コード、Tickerオブジェクト、取得元、属性名のリスト、未取得の属性の台帳
+# 戻値:属性の値のリスト
+def get_endpoint_values(ticker_num, ticker_data, endpoint, keys, ledger):
+    try:
+        endpoint_data = getattr(ticker_data, endpoint)[ticker_num]
+    except Exception as e:
+        for key in keys:
+            ledger.record_exception(ticker_num, endpoint, key, e)
+        return [np.nan] * len(keys)
+
+    # 銘柄が見つからない場合などは辞書ではなくエラーメッセージの文字列が返される
+    if not isinstance(endpoint_data, dict):
+        for key in keys:
+            ledger.record(ticker_num, endpoint, key, str(endpoint_data))
+        return [np.nan] * len(keys)
+
+    values = []
+    for key in keys:
+        if key not in endpoint_data:
+            ledger.record(ticker_num, endpoint, key, 'missing')
+            values.append(np.nan)
+            continue
+
+        value = normalize_value(endpoint_data[key])
+        if pd.isna(value):
+            ledger.record(ticker_num, endpoint, key, 'empty')
+        values.append(value)
+
+    return values
+
+
 # 企業の財務状況を取得する
-# 引数:証券コード、Tickerオブジェクト
+# 引数:証券コード、Tickerオブジェクト、未取得の属性の台帳
 # 戻値:企業の財務状況:Dataframe
-def get_company_finacial_info(ticker_data):
+def get_company_finacial_info(ticker_num, ticker_data, ledger):
     # income_statement(損益計算書)、cash_flow、balance_sheet(貸借対照表)を取得する
     try:
         income_statement = ticker_data.income_statement(trailing=False)
         cash_flow = ticker_data.cash_flow(trailing=False)
         balance_sheet = ticker_data.balance_sheet()
     except Exception as e:
-        print(e)
+        ledger.record_exception(ticker_num, 'financial_statements', 'asOfDate', e)
         return
 
     # 過去の売上高、純利益、純資産、総資産を取得する
@@ -142,7 +347,9 @@ def get_company_finacial_info(ticker_data):
         past_stockholdersequity = balance_sheet[['asOfDate', 'StockholdersEquity']]
         past_totalassets = balance_sheet[['asOfDate', 'TotalAssets']]
     except Exception as e:
-        print(e)
+        ledger.record_missing_columns(ticker_num, 'income_statement', income_statement, ['asOfDate', 'TotalRevenue'])
+        ledger.record_missing_columns(ticker_num, 'cash_flow', cash_flow, ['asOfDate', 'NetIncome'])
+        ledger.record_missing_columns(ticker_num, 'balance_sheet', balance_sheet, ['asOfDate', 'StockholdersEquity', 'TotalAssets'])
         return
 
     # income_statement(損益計算書)、cash_flow、balance_sheet(貸借対照表)の決算日を取得する
@@ -193,5 +400,28 @@ def get_company_finacial_info(ticker_data):
     return df_financial_info
 
 
+# コマンドライン引数を解析する
+# 引数:無し
+# 戻値:コマンドライン引数
+def parse_args():
+    parser = argparse.ArgumentParser(description='東証上場銘柄の財務指標と財務情報を取得する')
+    parser.add_argument('--listing', nargs='+', default=['./data_j.xls'],
+                        help='東証上場銘柄一覧のファイル名(複数指定した場合は銘柄一覧ごとに出力ファイルを分ける)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--local-dividends', action='store_true',
+                       help='配当利回り、過去5年間の配当利回り平均を株価と配当の履歴から算出する')
+    group.add_argument('--dividends-only', action='store_true',
+                       help='株価と配当の履歴のみを更新し、配当の指標を保存する')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='出力した表を当日の版として差分で保存する')
+    parser.add_argument('--snapshot-name', nargs='+',
+                        help='版を保存する表の名前に付ける名前(--listingと同じ順に指定する、省略時は銘柄一覧のファイル名)')
+    parser.add_argument('--profile', action='store_true',
+                        help='銘柄ごとの処理時間を計測し、処理の遅い銘柄をレポートに保存する')
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help='レポートにプロファイルを保存する銘柄数')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(parse_args())
\ No newline at end of file
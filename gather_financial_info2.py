@@ -2,14 +2,24 @@
 # 事前に以下のリンクから東証上場銘柄一覧を取得し、[data_j.xls]のファイル名で保存する
 # https://www.jpx.co.jp/markets/statistics-equities/misc/01.html
 # 本プログラムと[data_j.xls]を同一フォルダに配置する
-# usage: python gather_financial_info.py
+# usage: python gather_financial_info2.py [--profile [--profile-top N]]
+#    --profile          銘柄ごとの処理時間を通信とローカル処理に分けて計測し、処理の遅い銘柄を保存する
 # 出力ファイルの一覧
 # - company_metrics.csv
 #    証券コード,1株当りの配当金,配当利回り,過去5年間の配当利回り平均,配当性向,時価総額
 # - company_financial_info.csv
 #    証券コード,売上高,純利益,総資産,自己資本比率,自己資本利益率
+# - missing_fields.csv
+#    証券コード,取得元,属性名,理由
+# - missing_field_summary.csv
+#    属性名ごと、33業種ごとの未取得率
+# - profile_tickers.csv (--profile指定時)
+#    証券コード,処理時間,通信時間,ローカル処理時間
+# - profile_report.txt (--profile指定時)
+#    処理時間の長い上位の銘柄の処理時間とプロファイル
 
 # 標準ライブラリの読み込み
+import argparse
 import os
 
 import numpy as np
@@ -17,6 +27,12 @@ import numpy as np
 # データフレームのライブラリを読み込む
 import pandas as pd
 
+# 未取得の属性を記録する台帳を読み込む
+from missing_field_ledger import MissingFieldLedger, normalize_value
+
+# 銘柄ごとの処理時間を計測するモジュールを読み込む
+from ticker_profiler import TickerProfiler
+
 # yahooqueryのライブラリを読み込む
 from yahooquery import Ticker
 
@@ -25,9 +41,9 @@ from tqdm import tqdm
 
 
 # メイン処理
-# 引数:無し
+# 引数:コマンドライン引数
 # 戻値:無し
-def main():
+def main(args):
     # 東証上場銘柄一覧を読み込む
     is_file = os.path.isfile('./data_j2.xls')
     if is_file:
@@ -56,12 +72,17 @@ def main():
     series_type_33 = pd.Series()
     series_type_17 = pd.Series()
 
+    # 未取得の属性を記録する台帳を用意する
+    ledger = MissingFieldLedger()
+
+    # 銘柄ごとの処理時間を計測する(--profile指定時のみ)
+    profiler = TickerProfiler(enabled=args.profile, top_n=args.profile_top)
+
     # tickerの企業情報の指標、財務状況を取得する
     for ticker in tqdm(df_data_j['コード']):
         # 証券コードに「.T」を追加する
         df_data_j_filter = df_data_j[df_data_j['コード'] == ticker]
         ticker_num = str(ticker) + '.T'
-        ticker_data = Ticker(ticker_num)
 
         series_ticker_name = pd.concat([series_ticker_name, df_data_j_filter['銘柄名']])
         series_market_product_category = pd.concat([series_market_product_category, df_data_j_filter['市場・商品区分']])
@@ -69,8 +90,10 @@ def main():
         series_type_17 = pd.concat([series_type_17, df_data_j_filter['17業種区分']])
 
         # 企業情報の指標、財務状況を取得する
-        df_company_metrics = pd.concat([df_company_metrics, get_company_metrics(ticker_num, ticker_data)])
-        df_company_financial_info = pd.concat([df_company_financial_info, get_company_finacial_info(ticker_data)])
+        with profiler.measure(ticker_num):
+            ticker_data = profiler.create(Ticker, ticker_num)
+            df_company_metrics = pd.concat([df_company_metrics, get_company_metrics(ticker_num, ticker_data, ledger)])
+            df_company_financial_info = pd.concat([df_company_financial_info, get_company_finacial_info(ticker_num, ticker_data, ledger)])
 
     # 銘柄名を追加し、列を並び替える
     df_company_metrics['ticker_name'] = series_ticker_name.values
@@ -87,31 +110,28 @@ def main():
     df_company_metrics.to_csv('./company_metrics.csv', encoding='cp932', index=False, errors='ignore')
     df_company_financial_info.to_csv('./company_financial_info.csv', encoding='cp932', index=False, errors='ignore')
 
+    # 未取得の属性と、属性名・33業種ごとの未取得率をファイルに保存する
+    series_sector = pd.Series(df_data_j['33業種区分'].values, index=df_data_j['コード'].astype(str) + '.T')
+    ledger.flush(series_sector)
+
+    # 処理時間の長い銘柄をレポートに保存する
+    profiler.write_report()
+
 
 # 企業の財務指標を取得する
-# 引数:証券コード、Tickerオブジェクト
+# 引数:証券コード、Tickerオブジェクト、未取得の属性の台帳
 # 戻値:企業の財務指標:Dataframe
-def get_company_metrics(ticker_num, ticker_data):
+def get_company_metrics(ticker_num, ticker_data, ledger):
     # 企業の財務指標を保存するリストを用意する
     company_metrics = [ticker_num]
 
     # summary_detailを用いて1株当りの配当金,配当利回り,過去5年間の配当利回り平均,配当性向,時価総額を取得する
     summary_detail_keys = ['dividendRate', 'dividendYield', 'fiveYearAvgDividendYield', 'payoutRatio', 'marketCap']
-    for summary_detail_key in summary_detail_keys:
-        try:
-            company_metrics.append(ticker_data.summary_detail[ticker_num][summary_detail_key])
-        except Exception as e:
-            print('証券コード:{},未取得の属性:{}'.format(ticker_num, summary_detail_key))
-            company_metrics.append(np.nan)
+    company_metrics.extend(get_endpoint_values(ticker_num, ticker_data, 'summary_detail', summary_detail_keys, ledger))
 
     # financial_dataを用いて売上高、自己資本利益率を取得する
     financial_data_keys = ['totalRevenue', 'returnOnEquity']
-    for financial_data_key in financial_data_keys:
-        try:
-            company_metrics.append(ticker_data.financial_data[ticker_num][financial_data_key])
-        except Exception as e:
-            print('証券コード:{},未取得の属性:{}'.format(ticker_num, financial_data_key))
-            company_metrics.append(np.nan)
+    company_metrics.extend(get_endpoint_values(ticker_num, ticker_data, 'financial_data', financial_data_keys, ledger))
 
     # 企業の財務指標を保存する
     # 証券コード,1株当りの配当金,配当利回り,過去5年間の配当利回り平均,配当性向,時価総額,売上高,自己資本利益率
@@ -122,10 +142,43 @@ def get_company_metrics(ticker_num, ticker_data):
     return df_company_metrics
 
 
+# 取得元(summary_detail、financial_data)から属性の値を取得する
+# 取得元は1回だけ取得し、取得できなかった属性は台帳に記録してNaNとする
+# 引数:証券コード、Tickerオブジェクト、取得元、属性名のリスト、未取得の属性の台帳
+# 戻値:属性の値のリスト
+def get_endpoint_values(ticker_num, ticker_data, endpoint, keys, ledger):
+    try:
+        endpoint_data = getattr(ticker_data, endpoint)[ticker_num]
+    except Exception as e:
+        for key in keys:
+            ledger.record_exception(ticker_num, endpoint, key, e)
+        return [np.nan] * len(keys)
+
+    # 銘柄が見つからない場合などは辞書ではなくエラーメッセージの文字列が返される
+    if not isinstance(endpoint_data, dict):
+        for key in keys:
+            ledger.record(ticker_num, endpoint, key, str(endpoint_data))
+        return [np.nan] * len(keys)
+
+    values = []
+    for key in keys:
+        if key not in endpoint_data:
+            ledger.record(ticker_num, endpoint, key, 'missing')
+            values.append(np.nan)
+            continue
+
+        value = normalize_value(endpoint_data[key])
+        if pd.isna(value):
+            ledger.record(ticker_num, endpoint, key, 'empty')
+        values.append(value)
+
+    return values
+
+
 # 企業の財務状況を取得する
-# 引数:証券コード、Tickerオブジェクト
+# 引数:証券コード、Tickerオブジェクト、未取得の属性の台帳
 # 戻値:企業の財務状況:Dataframe
-def get_company_finacial_info(ticker_data):
+def get_company_finacial_info(ticker_num, ticker_data, ledger):
     # income_statement(損益計算書)、cash_flow、balance_sheet(貸借対照表)を取得する
     try:
         income_statement = ticker_data.income_statement(trailing=False)
@@ -133,20 +186,19 @@ def get_company_finacial_info(ticker_data):
         cash_flow = ticker_data.cash_flow(trailing=False)
         balance_sheet = ticker_data.balance_sheet()
     except Exception as e:
-        print(e)
+        ledger.record_exception(ticker_num, 'financial_statements', 'asOfDate', e)
         return
 
     # 過去の売上高、純利益、純資産、総資産を取得する
     try:
         past_totalrevenue = income_statement[['asOfDate', 'TotalRevenue']]
     except Exception as e:
-        print(e)
+        ledger.record_missing_columns(ticker_num, 'income_statement', income_statement, ['asOfDate', 'TotalRevenue'])
         return        
     try:
         past_grossprofit =  income_statement[['asOfDate', 'GrossProfit']]
     except Exception as e:
-        print(e)
-        print(income_statement[['asOfDate']])
+        ledger.record(ticker_num, 'income_statement', 'GrossProfit', 'zero_filled')
         income_statement[['GrossProfit']]  = 0
         past_grossprofit =  income_statement[['asOfDate', 'GrossProfit']]
 
@@ -156,13 +208,13 @@ def get_company_finacial_info(ticker_data):
         past_DilutedNIAvailtoComStockholders = income_statement[['asOfDate', 'DilutedNIAvailtoComStockholders']]
         past_EBIT =  income_statement[['asOfDate', 'EBIT']]
     except Exception as e:
-        print(e)
+        ledger.record_missing_columns(ticker_num, 'income_statement', income_statement, ['CostOfRevenue', 'DilutedNIAvailtoComStockholders', 'EBIT'])
         return   
     try:
         past_EBITDA =  income_statement[['asOfDate', 'EBITDA']]
     except Exception as e:
-        print(e)
 #        print("setting EBITDA")
+        ledger.record(ticker_num, 'income_statement', 'EBITDA', 'zero_filled')
         income_statement[['EBITDA']]  = 0
         past_EBITDA =  income_statement[['asOfDate', 'EBITDA']]
 #        print(past_EBITDA)
@@ -170,190 +222,225 @@ def get_company_finacial_info(ticker_data):
     try:
         past_EarningsFromEquityInterest = income_statement[['asOfDate', 'EarningsFromEquityInterest']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'EarningsFromEquityInterest', 'zero_filled')
         income_statement[['EarningsFromEquityInterest']]  = 0
         past_EarningsFromEquityInterest = income_statement[['asOfDate', 'EarningsFromEquityInterest']]
     try:     
         past_EarningsFromEquityInterestNetOfTax = income_statement[['asOfDate', 'EarningsFromEquityInterestNetOfTax']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'EarningsFromEquityInterestNetOfTax', 'zero_filled')
         income_statement[['EarningsFromEquityInterestNetOfTax']]  = 0
         past_EarningsFromEquityInterestNetOfTax = income_statement[['asOfDate', 'EarningsFromEquityInterestNetOfTax']]
         
     try:
         past_GainOnSaleOfSecurity = income_statement[['asOfDate', 'GainOnSaleOfSecurity']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'GainOnSaleOfSecurity', 'zero_filled')
         income_statement[['GainOnSaleOfSecurity']]  = 0
         past_GainOnSaleOfSecurity = income_statement[['asOfDate', 'GainOnSaleOfSecurity']]    
         
     try:  
         past_InterestExpense = income_statement[['asOfDate', 'InterestExpense']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'InterestExpense', 'zero_filled')
         income_statement[['InterestExpense']]  = 0
         past_InterestExpense = income_statement[['asOfDate', 'InterestExpense']] 
     try: 
         past_InterestExpenseNonOperating = income_statement[['asOfDate', 'InterestExpenseNonOperating']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'InterestExpenseNonOperating', 'zero_filled')
         income_statement[['InterestExpenseNonOperating']]  = 0
         past_InterestExpenseNonOperating = income_statement[['asOfDate', 'InterestExpenseNonOperating']]
     try:     
         past_InterestIncome = income_statement[['asOfDate', 'InterestIncome']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'InterestIncome', 'zero_filled')
         income_statement[['InterestIncome']]  = 0
         past_InterestIncome = income_statement[['asOfDate', 'InterestIncome']]
     try:   
         past_InterestIncomeNonOperating = income_statement[['asOfDate', 'InterestIncomeNonOperating']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'InterestIncomeNonOperating', 'zero_filled')
         income_statement[['InterestIncomeNonOperating']]  = 0   
         past_InterestIncomeNonOperating = income_statement[['asOfDate', 'InterestIncomeNonOperating']]
     try:
         past_MinorityInterests = income_statement[['asOfDate', 'MinorityInterests']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'MinorityInterests', 'zero_filled')
         income_statement[['MinorityInterests']]  = 0   
         past_MinorityInterests = income_statement[['asOfDate', 'MinorityInterests']]
     try:
         past_NetIncome = income_statement[['asOfDate', 'NetIncome']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NetIncome', 'zero_filled')
         income_statement[['NetIncome']]  = 0   
         past_NetIncome = income_statement[['asOfDate', 'NetIncome']]
         
     try:   
         past_NetIncomeCommonStockholders = income_statement[['asOfDate', 'NetIncomeCommonStockholders']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NetIncomeCommonStockholders', 'zero_filled')
         income_statement[['NetIncomeCommonStockholders']]  = 0   
         past_NetIncomeCommonStockholders = income_statement[['asOfDate', 'NetIncomeCommonStockholders']]
     try:      
         past_NetIncomeContinuousOperations = income_statement[['asOfDate', 'NetIncomeContinuousOperations']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NetIncomeContinuousOperations', 'zero_filled')
         income_statement[['NetIncomeContinuousOperations']]  = 0   
         past_NetIncomeContinuousOperations = income_statement[['asOfDate', 'NetIncomeContinuousOperations']]
     try:    
         past_NetIncomeFromContinuingAndDiscontinuedOperation = income_statement[['asOfDate', 'NetIncomeFromContinuingAndDiscontinuedOperation']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NetIncomeFromContinuingAndDiscontinuedOperation', 'zero_filled')
         income_statement[['NetIncomeFromContinuingAndDiscontinuedOperation']]  = 0   
         past_NetIncomeFromContinuingAndDiscontinuedOperation = income_statement[['asOfDate', 'NetIncomeFromContinuingAndDiscontinuedOperation']]
     try:         
         past_NetIncomeIncludingNoncontrollingInterests = income_statement[['asOfDate', 'NetIncomeIncludingNoncontrollingInterests']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NetIncomeIncludingNoncontrollingInterests', 'zero_filled')
         income_statement[['NetIncomeIncludingNoncontrollingInterests']]  = 0 
         past_NetIncomeIncludingNoncontrollingInterests = income_statement[['asOfDate', 'NetIncomeIncludingNoncontrollingInterests']]
     try:     
         past_NetInterestIncome = income_statement[['asOfDate', 'NetInterestIncome']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NetInterestIncome', 'zero_filled')
         income_statement[['NetInterestIncome']]  = 0 
         past_NetInterestIncome = income_statement[['asOfDate', 'NetInterestIncome']]
     try: 
         past_NetNonOperatingInterestIncomeExpense = income_statement[['asOfDate', 'NetNonOperatingInterestIncomeExpense']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NetNonOperatingInterestIncomeExpense', 'zero_filled')
         income_statement[['NetNonOperatingInterestIncomeExpense']]  = 0 
         past_NetNonOperatingInterestIncomeExpense = income_statement[['asOfDate', 'NetNonOperatingInterestIncomeExpense']]
     try: 
         past_NormalizedEBITDA = income_statement[['asOfDate', 'NormalizedEBITDA']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NormalizedEBITDA', 'zero_filled')
         income_statement[['NormalizedEBITDA']]  = 0 
         past_NormalizedEBITDA = income_statement[['asOfDate', 'NormalizedEBITDA']]
     try: 
         past_NormalizedIncome = income_statement[['asOfDate', 'NormalizedIncome']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'NormalizedIncome', 'zero_filled')
         income_statement[['NormalizedIncome']]  = 0 
         past_NormalizedIncome = income_statement[['asOfDate', 'NormalizedIncome']]
         
     try:
         past_OperatingExpense = income_statement[['asOfDate', 'OperatingExpense']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'OperatingExpense', 'zero_filled')
         income_statement[['OperatingExpense']]  = 0 
         past_OperatingExpense = income_statement[['asOfDate', 'OperatingExpense']]
     try:
         past_OperatingIncome = income_statement[['asOfDate', 'OperatingIncome']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'OperatingIncome', 'zero_filled')
         income_statement[['OperatingIncome']]  = 0 
         past_OperatingIncome = income_statement[['asOfDate', 'OperatingIncome']]
     try:       
         past_OperatingRevenue = income_statement[['asOfDate', 'OperatingRevenue']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'OperatingRevenue', 'zero_filled')
         income_statement[['OperatingRevenue']]  = 0 
         past_OperatingRevenue = income_statement[['asOfDate', 'OperatingRevenue']]
     try:        
         past_OtherIncomeExpense = income_statement[['asOfDate', 'OtherIncomeExpense']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'OtherIncomeExpense', 'zero_filled')
         income_statement[['OtherIncomeExpense']]  = 0 
         past_OtherIncomeExpense = income_statement[['asOfDate', 'OtherIncomeExpense']]
     try: 
         past_OtherNonOperatingIncomeExpenses = income_statement[['asOfDate', 'OtherNonOperatingIncomeExpenses']] 
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'OtherNonOperatingIncomeExpenses', 'zero_filled')
         income_statement[['OtherNonOperatingIncomeExpenses']]  = 0 
         past_OtherNonOperatingIncomeExpenses = income_statement[['asOfDate', 'OtherNonOperatingIncomeExpenses']] 
 
     try: 
         past_OtherunderPreferredStockDividend = income_statement[['asOfDate', 'OtherunderPreferredStockDividend']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'OtherunderPreferredStockDividend', 'zero_filled')
         income_statement[['OtherunderPreferredStockDividend']]  = 0 
         past_OtherunderPreferredStockDividend = income_statement[['asOfDate', 'OtherunderPreferredStockDividend']]
 
     try:     
         past_PretaxIncome = income_statement[['asOfDate', 'PretaxIncome']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'PretaxIncome', 'zero_filled')
         income_statement[['PretaxIncome']]  = 0 
         past_PretaxIncome = income_statement[['asOfDate', 'PretaxIncome']]
 
     try:    
         past_ReconciledCostOfRevenue = income_statement[['asOfDate', 'ReconciledCostOfRevenue']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'ReconciledCostOfRevenue', 'zero_filled')
         income_statement[['ReconciledCostOfRevenue']]  = 0 
         past_ReconciledCostOfRevenue = income_statement[['asOfDate', 'ReconciledCostOfRevenue']]
         
     try:         
         past_ReconciledDepreciation = income_statement[['asOfDate', 'ReconciledDepreciation']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'ReconciledDepreciation', 'zero_filled')
         income_statement[['ReconciledDepreciation']]  = 0 
         past_ReconciledDepreciation = income_statement[['asOfDate', 'ReconciledDepreciation']]
     try:        
         past_SellingGeneralAndAdministration = income_statement[['asOfDate', 'SellingGeneralAndAdministration']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'SellingGeneralAndAdministration', 'zero_filled')
         income_statement[['SellingGeneralAndAdministration']]  = 0 
         past_SellingGeneralAndAdministration = income_statement[['asOfDate', 'SellingGeneralAndAdministration']]
         
     try:         
         past_TaxEffectOfUnusualItems = income_statement[['asOfDate', 'TaxEffectOfUnusualItems']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TaxEffectOfUnusualItems', 'zero_filled')
         income_statement[['TaxEffectOfUnusualItems']]  = 0
         past_TaxEffectOfUnusualItems = income_statement[['asOfDate', 'TaxEffectOfUnusualItems']]      
 
     try:
         past_TaxProvision = income_statement[['asOfDate', 'TaxProvision']]    
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TaxProvision', 'zero_filled')
         income_statement[['TaxProvision']]  = 0
         past_TaxProvision = income_statement[['asOfDate', 'TaxProvision']]
         
     try:     
         past_TaxRateForCalcs = income_statement[['asOfDate', 'TaxRateForCalcs']]   
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TaxRateForCalcs', 'zero_filled')
         income_statement[['TaxRateForCalcs']]  = 0     
         past_TaxRateForCalcs = income_statement[['asOfDate', 'TaxRateForCalcs']]   
     try:        
         past_TotalExpenses = income_statement[['asOfDate', 'TotalExpenses']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TotalExpenses', 'zero_filled')
         income_statement[['TotalExpenses']]  = 0           
         past_TotalExpenses = income_statement[['asOfDate', 'TotalExpenses']]
         
     try:               
         past_TotalOperatingIncomeAsReported = income_statement[['asOfDate', 'TotalOperatingIncomeAsReported']]
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TotalOperatingIncomeAsReported', 'zero_filled')
         income_statement[['TotalOperatingIncomeAsReported']]  = 0    
         past_TotalOperatingIncomeAsReported = income_statement[['asOfDate', 'TotalOperatingIncomeAsReported']]
     try:
         past_TotalOtherFinanceCost = income_statement[['asOfDate', 'TotalOtherFinanceCost']] 
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TotalOtherFinanceCost', 'zero_filled')
         income_statement[['TotalOtherFinanceCost']]  = 0    
         past_TotalOtherFinanceCost = income_statement[['asOfDate', 'TotalOtherFinanceCost']]
     try:
         past_TotalUnusualItems = income_statement[['asOfDate', 'TotalUnusualItems']]
             
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TotalUnusualItems', 'zero_filled')
         income_statement[['TotalUnusualItems']]  = 0    
         past_TotalUnusualItems = income_statement[['asOfDate', 'TotalUnusualItems']]
     try:
         past_TotalUnusualItemsExcludingGoodwill = income_statement[['asOfDate', 'TotalUnusualItemsExcludingGoodwill']]
             
     except Exception as e:
+        ledger.record(ticker_num, 'income_statement', 'TotalUnusualItemsExcludingGoodwill', 'zero_filled')
         income_statement[['TotalUnusualItemsExcludingGoodwill']]  = 0    
         past_TotalUnusualItemsExcludingGoodwill = income_statement[['asOfDate', 'TotalUnusualItemsExcludingGoodwill']]
         
@@ -362,7 +449,8 @@ def get_company_finacial_info(ticker_data):
         past_stockholdersequity = balance_sheet[['asOfDate', 'StockholdersEquity']]
         past_totalassets = balance_sheet[['asOfDate', 'TotalAssets']]
     except Exception as e:
-        print(e)
+        ledger.record_missing_columns(ticker_num, 'cash_flow', cash_flow, ['asOfDate', 'NetIncome'])
+        ledger.record_missing_columns(ticker_num, 'balance_sheet', balance_sheet, ['asOfDate', 'StockholdersEquity', 'TotalAssets'])
 #        print(income_statement.T)
         return
 
@@ -472,7 +560,7 @@ def get_company_finacial_info(ticker_data):
             result_past_stockholdersequity = pd.concat([result_past_stockholdersequity, past_stockholdersequity[past_stockholdersequity['asOfDate'] == asofdate]])
             result_past_totalassets = pd.concat([result_past_totalassets, past_totalassets[past_totalassets['asOfDate'] == asofdate]])
     except Exception as e:
-        print(e)
+        ledger.record_exception(ticker_num, 'financial_statements', 'asOfDate', e)
         return
     
     # 時刻で昇順に並び替える
@@ -575,5 +663,17 @@ def get_company_finacial_info(ticker_data):
     return df_financial_info
 
 
+# コマンドライン引数を解析する
+# 引数:無し
+# 戻値:コマンドライン引数
+def parse_args():
+    parser = argparse.ArgumentParser(description='東証上場銘柄の財務指標と財務情報を取得する')
+    parser.add_argument('--profile', action='store_true',
+                        help='銘柄ごとの処理時間を計測し、処理の遅い銘柄をレポートに保存する')
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help='レポートにプロファイルを保存する銘柄数')
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    main(parse_args())
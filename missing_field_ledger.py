@@ -0,0 +1,113 @@
+# 取得できなかった属性(証券コード、取得元、属性名、理由)を記録する台帳
+# 取得処理中は標準出力に書き出さずメモリ上に蓄積し、処理の最後にまとめてファイルへ保存する
+# 出力ファイルの一覧
+# - missing_fields.csv
+#    証券コード,取得元,属性名,理由
+# - missing_field_summary.csv
+#    取得元・属性名ごと、33業種ごとの未取得率
+
+# データフレームのライブラリを読み込む
+import numpy as np
+import pandas as pd
+
+
+# 未取得の属性を記録するクラス
+class MissingFieldLedger:
+    columns = ['symbol', 'endpoint', 'field', 'reason']
+
+    # 初期化
+    # 引数:無し
+    # 戻値:無し
+    def __init__(self):
+        # 記録は列ごとのリストに追加し、保存時に一括でデータフレームに変換する
+        self.records = {column: [] for column in self.columns}
+
+    # 未取得の属性を1件記録する
+    # 引数:証券コード、取得元、属性名、理由
+    # 戻値:無し
+    def record(self, symbol, endpoint, field, reason):
+        self.records['symbol'].append(symbol)
+        self.records['endpoint'].append(endpoint)
+        self.records['field'].append(field)
+        self.records['reason'].append(reason)
+
+    # 例外を理由として未取得の属性を記録する
+    # 引数:証券コード、取得元、属性名、例外
+    # 戻値:無し
+    def record_exception(self, symbol, endpoint, field, e):
+        self.record(symbol, endpoint, field, '{}: {}'.format(type(e).__name__, e))
+
+    # データフレームに無い列を未取得の属性として記録する
+    # 引数:証券コード、取得元、取得したデータ、属性名のリスト
+    # 戻値:無し
+    def record_missing_columns(self, symbol, endpoint, data, fields):
+        # データが無い場合はデータフレームではなくエラーメッセージの文字列が返される
+        if not isinstance(data, pd.DataFrame):
+            for field in fields:
+                self.record(symbol, endpoint, field, str(data))
+            return
+
+        for field in fields:
+            if field not in data.columns:
+                self.record(symbol, endpoint, field, 'missing')
+
+    # 記録件数を返す
+    # 引数:無し
+    # 戻値:記録件数
+    def __len__(self):
+        return len(self.records['symbol'])
+
+    # 記録をデータフレームに変換する
+    # 引数:無し
+    # 戻値:未取得の属性の一覧:Dataframe
+    def to_dataframe(self):
+        df_ledger = pd.DataFrame(self.records, columns=self.columns)
+
+        # 同じ値が繰り返し現れるため、カテゴリ型にしてメモリを節約する
+        for column in ['symbol', 'endpoint', 'field']:
+            df_ledger[column] = df_ledger[column].astype('category')
+
+        return df_ledger
+
+    # 取得元・属性名、業種ごとの未取得率を集計する
+    # 同じ属性名でも取得元が異なれば別の問題として数える(例:income_statementとcash_flowのNetIncome)
+    # 引数:証券コードと業種の対応:Series(indexが証券コード)
+    # 戻値:未取得率の表:Dataframe(行が取得元・属性名、列が業種)
+    def summary(self, series_sector):
+        df_ledger = self.to_dataframe()
+        if df_ledger.empty:
+            return pd.DataFrame()
+
+        # 同じ銘柄・取得元・属性の重複を除いて業種を付与する
+        df_missing = df_ledger[['symbol', 'endpoint', 'field']].astype(str).drop_duplicates()
+        df_missing['sector'] = df_missing['symbol'].map(series_sector)
+
+        # 業種ごとの銘柄数で割り、未取得率を求める
+        # 未取得の属性が無い業種も0として列に含める
+        series_sector_size = series_sector.value_counts()
+        df_count = pd.crosstab([df_missing['endpoint'], df_missing['field']], df_missing['sector'])
+        df_count = df_count.reindex(columns=series_sector.unique(), fill_value=0)
+        df_summary = df_count.div(series_sector_size.reindex(df_count.columns), axis=1)
+
+        # 全業種の未取得率を追加する
+        df_summary['全業種'] = df_count.sum(axis=1) / len(series_sector)
+
+        return df_summary.sort_values('全業種', ascending=False)
+
+    # 記録と集計をまとめてファイルに保存する
+    # 引数:証券コードと業種の対応:Series、台帳の保存先、集計の保存先
+    # 戻値:無し
+    def flush(self, series_sector, ledger_path='./missing_fields.csv', summary_path='./missing_field_summary.csv'):
+        self.to_dataframe().to_csv(ledger_path, encoding='cp932', index=False, errors='ignore')
+        self.summary(series_sector).to_csv(summary_path, encoding='cp932', errors='ignore')
+        print('未取得の属性:{}件を[{}]に保存しました。'.format(len(self), ledger_path))
+
+
+# yahooqueryが返す値を正規化する
+# 値が無い属性は空の辞書({})として返されることがあるため、NaNに置き換える
+# 引数:取得した値
+# 戻値:正規化した値、値が無い場合はNaN
+def normalize_value(value):
+    if isinstance(value, dict) or value is None:
+        return np.nan
+    return value
@@ -0,0 +1,274 @@
+# 実行ごとの出力(company_metrics.csv、company_financial_info.csv)を版として保存する
+# 前回の版との差分(変更されたセル、追加・削除された行)のみを圧縮して保存し、任意の日付時点の表を復元できるようにする
+# 一定の版数ごとに全体(ベース)を保存し、復元時に適用する差分の数を抑える
+# usage: python snapshot_store.py TABLE [--as-of YYYY-MM-DD] [--output FILE] [--compact-before YYYY-MM-DD [--checkpoint-every N]]
+#    TABLE              表の名前(company_metrics_data_j、company_financial_info_data_j等)
+#    --as-of            指定した日付時点の表を復元する(省略時は最新)
+#    --output           復元した表の保存先(省略時は先頭を表示する)
+#    --compact-before   指定した日付より前の版を日付ごとに1つにまとめ、ベースを置き直して差分の連鎖を短くする
+#                       まとめた後も全ての日付の表を復元できる
+#    --checkpoint-every まとめる際にベースを保存する間隔(版数、省略時は30)
+# 保存先の構成
+# - snapshots/<表の名前>/manifest.json
+#    キーの列名、版の一覧(日付、種類、ファイル名)、次の版の連番
+# - snapshots/<表の名前>/<日付>_<連番>.base.pkl.gz
+#    表全体
+# - snapshots/<表の名前>/<日付>_<連番>.delta.pkl.gz
+#    前回の版との差分
+# - snapshots/<表の名前>/latest.pkl.gz
+#    最新の版の表(差分の計算に使う)
+
+# 標準ライブラリの読み込み
+import argparse
+import json
+import os
+
+import numpy as np
+
+# データフレームのライブラリを読み込む
+import pandas as pd
+
+
+# ベースを保存する間隔(版数)
+CHECKPOINT_EVERY = 30
+
+
+# 表の版を保存、復元するクラス
+class SnapshotStore:
+
+    # 初期化
+    # 引数:保存先のフォルダ、ベースを保存する間隔(版数)
+    # 戻値:無し
+    def __init__(self, root='./snapshots', checkpoint_every=CHECKPOINT_EVERY):
+        self.root = root
+        self.checkpoint_every = checkpoint_every
+
+    # 表の版を保存する
+    # 引数:表の名前、表:Dataframe、キーの列名のリスト、日付(YYYY-MM-DD)
+    # 戻値:無し
+    def commit(self, table, df, keys, date):
+        table_dir = os.path.join(self.root, table)
+        os.makedirs(table_dir, exist_ok=True)
+        manifest = self.load_manifest(table)
+        manifest['keys'] = keys
+
+        # 同じキーの行が重複している場合は後の行を優先する
+        df = df.drop_duplicates(keys, keep='last').reset_index(drop=True)
+
+        versions = manifest['versions']
+        latest_path = os.path.join(table_dir, 'latest.pkl.gz')
+
+        # 初回、または前回のベースから一定の版数が経過した場合はベースを保存する
+        deltas_since_base = 0
+        for version in reversed(versions):
+            if version['kind'] == 'base':
+                break
+            deltas_since_base += 1
+
+        df_prev = None
+        if versions and os.path.isfile(latest_path) and deltas_since_base + 1 < self.checkpoint_every:
+            df_prev = pd.read_pickle(latest_path, compression='gzip')
+        versions.append(self.save_version(table_dir, manifest, date, df, df_prev))
+
+        df.to_pickle(latest_path, compression='gzip')
+        self.save_manifest(table, manifest)
+
+    # 1つの版をファイルに保存する
+    # 引数:表のフォルダ、版の一覧、日付(YYYY-MM-DD)、表:Dataframe、前回の版の表(Noneの場合はベースとして保存する)
+    # 戻値:版の情報:dict
+    def save_version(self, table_dir, manifest, date, df, df_prev):
+        name = self.next_name(table_dir, manifest, date)
+        if df_prev is None:
+            file_name = name + '.base.pkl.gz'
+            df.to_pickle(os.path.join(table_dir, file_name), compression='gzip')
+            return {'date': date, 'kind': 'base', 'file': file_name}
+
+        delta = calc_delta(df_prev, df, manifest['keys'])
+        file_name = name + '.delta.pkl.gz'
+        pd.to_pickle(delta, os.path.join(table_dir, file_name), compression='gzip')
+        return {'date': date, 'kind': 'delta', 'file': file_name,
+                'changed': len(delta['changed']), 'added': len(delta['added']), 'removed': len(delta['removed'])}
+
+    # 指定した日付時点の表を復元する
+    # 引数:表の名前、日付(YYYY-MM-DD、Noneの場合は最新)
+    # 戻値:表:Dataframe、該当する版が無い場合はNone
+    def read(self, table, as_of=None):
+        manifest = self.load_manifest(table)
+        versions = [version for version in manifest['versions'] if as_of is None or version['date'] <= as_of]
+        if not versions:
+            return None
+
+        # 直前のベースから順に差分を適用する
+        base_index = max(i for i, version in enumerate(versions) if version['kind'] == 'base')
+        table_dir = os.path.join(self.root, table)
+        df = pd.read_pickle(os.path.join(table_dir, versions[base_index]['file']), compression='gzip')
+        for version in versions[base_index + 1:]:
+            delta = pd.read_pickle(os.path.join(table_dir, version['file']), compression='gzip')
+            df = apply_delta(df, delta, manifest['keys'])
+
+        return df
+
+    # 指定した日付より前の版を日付ごとに1つの版にまとめ、一定の版数ごとにベースを置き直す
+    # 同じ日付の版は最後の版の時点の表のみを復元できるため、1つの差分にまとめても復元できる日付は変わらない
+    # 引数:表の名前、日付(YYYY-MM-DD)、ベースを保存する間隔(版数、省略時は初期化時の値)
+    # 戻値:まとめて減った版の数
+    def compact(self, table, before, checkpoint_every=None):
+        checkpoint_every = checkpoint_every or self.checkpoint_every
+        manifest = self.load_manifest(table)
+        versions = manifest['versions']
+        old_versions = [version for version in versions if version['date'] < before]
+        if not old_versions:
+            return 0
+
+        # 古い版を順に復元し、日付ごとの最後の時点の表を新しい版として保存する
+        table_dir = os.path.join(self.root, table)
+        new_versions = []
+        df = None
+        df_prev = None
+        for i, version in enumerate(old_versions):
+            data = pd.read_pickle(os.path.join(table_dir, version['file']), compression='gzip')
+            df = data if version['kind'] == 'base' else apply_delta(df, data, manifest['keys'])
+            if i + 1 < len(old_versions) and old_versions[i + 1]['date'] == version['date']:
+                continue
+
+            if len(new_versions) % checkpoint_every == 0:
+                df_prev = None
+            new_versions.append(self.save_version(table_dir, manifest, version['date'], df, df_prev))
+            df_prev = df
+
+        # 新しい版の一覧を保存してから古い版のファイルを削除する
+        manifest['versions'] = new_versions + versions[len(old_versions):]
+        self.save_manifest(table, manifest)
+
+        for version in old_versions:
+            os.remove(os.path.join(table_dir, version['file']))
+
+        return len(old_versions) - len(new_versions)
+
+    # 新しい版のファイル名(拡張子を除く)を決め、次の版の連番を進める
+    # まとめた版を削除した後も連番が戻らないよう、連番は版の一覧に保存する
+    # 引数:表のフォルダ、版の一覧、日付(YYYY-MM-DD)
+    # 戻値:ファイル名(拡張子を除く)
+    def next_name(self, table_dir, manifest, date):
+        # 連番を保存していない版の一覧は、既存のファイル名の最大の連番の次から始める
+        seq = manifest.get('next_seq')
+        if seq is None:
+            seq = max([int(version['file'].split('.')[0].rsplit('_', 1)[1]) + 1 for version in manifest['versions']], default=0)
+        manifest['next_seq'] = seq + 1
+
+        name = '{}_{:05d}'.format(date, seq)
+        for kind in ('base', 'delta'):
+            path = os.path.join(table_dir, '{}.{}.pkl.gz'.format(name, kind))
+            if os.path.exists(path):
+                raise FileExistsError('既存の版のファイルを上書きしようとしました: {}'.format(path))
+        return name
+
+    # 版の一覧を読み込む
+    # 引数:表の名前
+    # 戻値:版の一覧:dict
+    def load_manifest(self, table):
+        manifest_path = os.path.join(self.root, table, 'manifest.json')
+        if not os.path.isfile(manifest_path):
+            return {'keys': [], 'versions': []}
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    # 版の一覧を保存する
+    # 引数:表の名前、版の一覧
+    # 戻値:無し
+    def save_manifest(self, table, manifest):
+        manifest_path = os.path.join(self.root, table, 'manifest.json')
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+
+# 前回の版との差分を計算する
+# 引数:前回の表:Dataframe、今回の表:Dataframe、キーの列名のリスト
+# 戻値:差分(列の並び、行の並び、削除された行のキー、追加された行、変更されたセル):dict
+def calc_delta(df_prev, df_cur, keys):
+    df_prev = df_prev.set_index(keys)
+    df_cur = df_cur.set_index(keys)
+    columns = df_cur.columns
+
+    # 削除された行、追加された行
+    removed = df_prev.index.difference(df_cur.index)
+    added = df_cur.index.difference(df_prev.index)
+
+    # 共通する行の変更されたセル(NaNからNaNへの変化は変更としない)
+    common = df_cur.index.intersection(df_prev.index, sort=False)
+    values_prev = df_prev.reindex(index=common, columns=columns).to_numpy(dtype=object)
+    values_cur = df_cur.loc[common].to_numpy(dtype=object)
+    mask = (values_prev != values_cur) & ~(pd.isna(values_prev) & pd.isna(values_cur))
+    rows, cols = np.nonzero(mask)
+    df_changed = pd.DataFrame({'row': list(common[rows]), 'column': columns[cols], 'value': values_cur[rows, cols]})
+
+    # 削除、追加を反映した並び(追加された行は末尾)と異なる場合のみ行の並びを保存する
+    order = None
+    if not df_prev.index.drop(removed).append(added).equals(df_cur.index):
+        order = df_cur.index
+
+    return {'columns': list(columns),
+            'order': order,
+            'removed': removed,
+            'added': df_cur.loc[added].reset_index(),
+            'changed': df_changed}
+
+
+# 差分を適用して次の版の表を復元する
+# 引数:表:Dataframe、差分、キーの列名のリスト
+# 戻値:次の版の表:Dataframe
+def apply_delta(df, delta, keys):
+    df = df.set_index(keys).reindex(columns=delta['columns'])
+    df = df.drop(index=delta['removed'])
+
+    # 変更されたセルを列ごとにまとめて反映する
+    for column, df_column in delta['changed'].groupby('column', sort=False):
+        df[column] = df[column].astype(object)
+        df.loc[pd.Index(df_column['row']), column] = df_column['value'].values
+
+    df = pd.concat([df, delta['added'].set_index(keys)])
+    if delta['order'] is not None:
+        df = df.reindex(delta['order'])
+
+    return df.reset_index().infer_objects()
+
+
+# メイン処理
+# 引数:コマンドライン引数
+# 戻値:無し
+def main(args):
+    store = SnapshotStore(args.root)
+
+    if args.compact_before:
+        count = store.compact(args.table, args.compact_before, args.checkpoint_every)
+        print('{}件の版をまとめました。'.format(count))
+        return
+
+    df = store.read(args.table, args.as_of)
+    if df is None:
+        print('該当する版がありません。')
+        return
+
+    if args.output:
+        df.to_csv(args.output, encoding='cp932', index=False, errors='ignore')
+    else:
+        print(df.head())
+
+
+# コマンドライン引数を解析する
+# 引数:無し
+# 戻値:コマンドライン引数
+def parse_args():
+    parser = argparse.ArgumentParser(description='保存した版から指定した日付時点の表を復元する')
+    parser.add_argument('table', help='表の名前')
+    parser.add_argument('--root', default='./snapshots', help='保存先のフォルダ')
+    parser.add_argument('--as-of', help='復元する日付(YYYY-MM-DD)')
+    parser.add_argument('--output', help='復元した表の保存先')
+    parser.add_argument('--compact-before', help='この日付より前の版を日付ごとにまとめ、差分の連鎖を短くする(YYYY-MM-DD)')
+    parser.add_argument('--checkpoint-every', type=int, help='まとめる際にベースを保存する間隔(版数)')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,148 @@
+# 銘柄ごとの処理時間を計測し、処理の遅い銘柄を特定する
+# 処理時間はyahooqueryのHTTPの往復(通信)と、応答の変換や取得後のデータの加工(ローカル処理)に分けて計測する
+# ローカル処理はcProfileでプロファイルを取り、処理時間の長い上位の銘柄のみプロファイルを保持する
+# 出力ファイルの一覧
+# - profile_tickers.csv
+#    証券コード,処理時間,通信時間,ローカル処理時間
+# - profile_report.txt
+#    処理時間の長い上位の銘柄の処理時間とプロファイル
+
+# 標準ライブラリの読み込み
+import cProfile
+import functools
+import heapq
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+# データフレームのライブラリを読み込む
+import pandas as pd
+
+
+# プロファイルに表示する関数の数
+PROFILE_LINES = 15
+
+
+# 銘柄ごとの処理時間を計測するクラス
+class TickerProfiler:
+
+    # 初期化
+    # 引数:有効にするかどうか、プロファイルを保持する銘柄数
+    # 戻値:無し
+    def __init__(self, enabled=False, top_n=20):
+        self.enabled = enabled
+        self.top_n = top_n
+
+        # 銘柄ごとの処理時間
+        self.timings = {'ticker': [], 'wall_time': [], 'network_time': [], 'local_time': []}
+
+        # 処理時間の長い上位の銘柄(処理時間、順番、証券コード、プロファイル)
+        self.slowest = []
+
+        # 計測中の銘柄の通信時間とプロファイル
+        self.network_time = 0.0
+        self.profile = None
+
+    # Tickerオブジェクトを作成し、HTTPの往復を通信時間として計測するようにする
+    # Tickerオブジェクトの作成時にはセッションの準備のため通信を行うため、作成も通信時間として計測する
+    # 引数:Tickerクラス、証券コード
+    # 戻値:Tickerオブジェクト
+    def create(self, ticker_class, ticker_num):
+        if not self.enabled:
+            return ticker_class(ticker_num)
+        ticker_data = self.call_network(ticker_class, ticker_num)
+        self.wrap_session(ticker_data.session)
+        return ticker_data
+
+    # セッションのget、postを通信時間を計測する関数に置き換える
+    # yahooqueryはHTTPの往復の後に応答のJSONをデータフレームに変換するため、変換はローカル処理としてプロファイルに含める
+    # 引数:yahooqueryのセッション
+    # 戻値:無し
+    def wrap_session(self, session):
+        # 同じセッションを複数のTickerオブジェクトで共有する場合に二重に計測しない
+        if getattr(session, '_ticker_profiler', None) is self:
+            return
+        session._ticker_profiler = self
+        for name in ['get', 'post']:
+            setattr(session, name, functools.partial(self.call_network, getattr(session, name)))
+
+    # 1銘柄分の処理時間を計測する
+    # 引数:証券コード
+    # 戻値:無し
+    @contextmanager
+    def measure(self, ticker_num):
+        if not self.enabled:
+            yield
+            return
+
+        self.network_time = 0.0
+        self.profile = cProfile.Profile()
+        start = time.perf_counter()
+        self.profile.enable()
+        try:
+            yield
+        finally:
+            self.profile.disable()
+            wall_time = time.perf_counter() - start
+            self.add(ticker_num, wall_time, self.profile)
+            self.profile = None
+
+    # 通信中はプロファイルを止め、通信時間を加算する
+    # 引数:通信を行う関数、関数の引数
+    # 戻値:関数の戻値
+    def call_network(self, func, *args, **kwargs):
+        if self.profile is not None:
+            self.profile.disable()
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.network_time += time.perf_counter() - start
+            if self.profile is not None:
+                self.profile.enable()
+
+    # 1銘柄分の計測結果を記録する
+    # 引数:証券コード、処理時間、プロファイル
+    # 戻値:無し
+    def add(self, ticker_num, wall_time, profile):
+        self.timings['ticker'].append(ticker_num)
+        self.timings['wall_time'].append(wall_time)
+        self.timings['network_time'].append(self.network_time)
+        self.timings['local_time'].append(wall_time - self.network_time)
+
+        # 上位に入る場合のみプロファイルを文字列に変換して保持する
+        if len(self.slowest) >= self.top_n and wall_time <= self.slowest[0][0]:
+            return
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        item = (wall_time, len(self.timings['ticker']), ticker_num, stream.getvalue())
+        if len(self.slowest) < self.top_n:
+            heapq.heappush(self.slowest, item)
+        else:
+            heapq.heapreplace(self.slowest, item)
+
+    # 計測結果をファイルに保存する
+    # 引数:銘柄ごとの処理時間の保存先、レポートの保存先
+    # 戻値:無し
+    def write_report(self, timings_path='./profile_tickers.csv', report_path='./profile_report.txt'):
+        if not self.enabled:
+            return
+
+        df_timings = pd.DataFrame(self.timings).sort_values('wall_time', ascending=False)
+        df_timings.to_csv(timings_path, index=False)
+
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write('銘柄数:{}\n'.format(len(df_timings)))
+            f.write('処理時間の合計:{:.1f}秒 (通信:{:.1f}秒、ローカル処理:{:.1f}秒)\n'.format(
+                df_timings['wall_time'].sum(), df_timings['network_time'].sum(), df_timings['local_time'].sum()))
+            f.write('処理時間の長い上位{}銘柄\n\n'.format(len(self.slowest)))
+            for wall_time, _, ticker_num, profile_text in sorted(self.slowest, reverse=True):
+                row = df_timings[df_timings['ticker'] == ticker_num].iloc[0]
+                f.write('=' * 80 + '\n')
+                f.write('証券コード:{} 処理時間:{:.3f}秒 (通信:{:.3f}秒、ローカル処理:{:.3f}秒)\n'.format(
+                    ticker_num, wall_time, row['network_time'], row['local_time']))
+                f.write(profile_text)
+                f.write('\n')
+
+        print('処理時間の長い銘柄を[{}]に保存しました。'.format(report_path))